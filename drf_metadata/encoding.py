@@ -0,0 +1,52 @@
+import json
+import typing as t
+
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(obj: t.Any) -> t.Any:
+    # lazy strings, decimals, querysets, etc. are handled the same way DRF JSONRenderer does
+    return _drf_encoder.default(obj)
+
+
+def dumps(obj: t.Any) -> bytes:
+    """
+    Encodes obj into compact utf-8 JSON bytes. Uses orjson if it's installed,
+        falls back to stdlib json with DRF JSONEncoder otherwise.
+    :param obj: any JSON-serializable object (DRF JSONEncoder rules apply)
+    :return: bytes
+    """
+    if orjson is not None:
+        # let DRF encoder format datetimes to stay compatible with JSONRenderer output
+        ret = orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    else:
+        ret = json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    # escape \u2028 and \u2029 the same way DRF JSONRenderer does
+    return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def dumps_fragment(obj: t.Mapping) -> bytes:
+    """
+    Encodes mapping into JSON object body without surrounding braces, i.e. `"a":1,"b":2`
+    :param obj: mapping
+    :return: bytes
+    """
+    return dumps(obj)[1:-1]
+
+
+def join_fragments(*fragments: bytes) -> bytes:
+    """
+    Assembles JSON object from object body fragments (see `dumps_fragment`)
+    :param fragments: bytes
+    :return: bytes
+    """
+    return b'{' + b','.join(f for f in fragments if f) + b'}'
@@ -1,15 +1,36 @@
 import django
 
+import hashlib
+import json
+import logging
+import threading
+import time
 import typing as t
 from collections import OrderedDict, namedtuple
-
-from django.db import models
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, FieldError
+from django.db import close_old_connections, connections, models
+from django.db.models import F, Value, Window
+from django.db.models.functions import RowNumber
+from django.db.models.query import ModelIterable
+from django.http import StreamingHttpResponse
 from django.http.request import HttpRequest as DjangoHttpRequest
 from django.utils.encoding import force_text
+from django.utils.functional import Promise
+from django.utils.translation import get_language, override
+from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import Serializer
 from rest_framework.views import APIView
 from rest_framework.request import Request as DRFHttpRequest
 
+from drf_metadata.encoding import dumps, dumps_fragment
+
+
+logger = logging.getLogger('drf_metadata')
 
 DRFMimicSerializer = namedtuple('DRFMimicSerializer', ['data'])
 DRFSerializerOrMimicSerializerType = t.Type[
@@ -25,21 +46,300 @@ DRFSerializerOrMimicSerializerType = t.Type[
 
 Request = t.Union[DjangoHttpRequest, DRFHttpRequest]
 
+RELATED_DATA_CACHE_PREFIX = 'drf_metadata:related_data'
+
+# serialized related dataset and its size in bytes, if it was measured when dataset was built
+RelatedDataEntry = namedtuple('RelatedDataEntry', ['data', 'size'])
+
+EXPAND_ALL = '__all__'
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting executed queries
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# noinspection PyProtectedMember
+def get_loaded_relations(obj: models.Model, prefix: str = '', max_depth: int = 3) -> t.Set[str]:
+    """
+    Returns select_related() lookups for forward relations cached on obj, i.e. accessed after obj was fetched
+    :param obj: model instance
+    :param prefix: lookup prefix
+    :param max_depth: max lookup depth
+    :return: set of lookups, e.g. {'publisher', 'publisher__owner'}
+    """
+    relations = set()
+    if max_depth <= 0:
+        return relations
+
+    for name, related_obj in obj._state.fields_cache.items():
+        try:
+            field = obj._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        # concrete forward relations only; select_related() can't follow generic foreign keys
+        if not field.is_relation or not field.concrete or field.many_to_many:
+            continue
+
+        lookup = prefix + name
+        relations.add(lookup)
+        if related_obj is not None:
+            relations |= get_loaded_relations(related_obj, lookup + '__', max_depth - 1)
+
+    return relations
+
+
+_refresh_executor: t.Optional[ThreadPoolExecutor] = None
+_refresh_executor_lock = threading.Lock()
+
+
+def get_refresh_executor(max_workers: int = 4) -> ThreadPoolExecutor:
+    """
+    Returns process-wide thread pool used for stale-while-revalidate refreshes
+    :param max_workers: pool size, used on first call only
+    :return: ThreadPoolExecutor
+    """
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _refresh_executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drf_metadata')
+    return _refresh_executor
+
+
+# noinspection PyProtectedMember
+def get_related_data_version_key(model: t.Type[models.Model]) -> str:
+    return '%s:version:%s' % (RELATED_DATA_CACHE_PREFIX, model._meta.label_lower)
+
+
+def get_related_data_version(model: t.Type[models.Model], cache_alias: str = 'default') -> int:
+    """
+    Returns current version of cached related datasets built from model
+    :param model: Django model class
+    :param cache_alias: django cache alias
+    :return: int
+    """
+    cache = caches[cache_alias]
+    version_key = get_related_data_version_key(model)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, 1, None)
+        version = cache.get(version_key, 1)
+    return version
+
+
+def invalidate_related_data(model: t.Type[models.Model], cache_alias: str = 'default') -> None:
+    """
+    Invalidates all cached related datasets built from model by bumping its version.
+        Connect it to post_save/post_delete signals or call it manually.
+    :param model: Django model class
+    :param cache_alias: django cache alias
+    """
+    cache = caches[cache_alias]
+    version_key = get_related_data_version_key(model)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.add(version_key, 2, None)
+
+
+class MetaDataContext:
+    """
+    Per-call state of MetaData and CustomMetadata: request, view, obj, requested fields, expansion state
+        and related rows fetched in batch. Metadata definitions are not modified in runtime,
+        so a single instance may be shared between threads.
+    """
+    __slots__ = (
+        'request', 'view', 'obj', 'only',
+        'expand_path', 'expand_level', 'expand_depth', 'expand_memo', 'expand_pruned',
+        'related_rows',
+    )
+
+    def __init__(self,
+                 request: t.Optional[Request] = None,
+                 view: t.Optional[APIView] = None,
+                 obj: t.Any = None,
+                 only: t.Optional[t.List[str]] = None,
+                 expand_path: t.Tuple[t.Type[models.Model], ...] = (),
+                 expand_level: int = 0,
+                 expand_depth: int = 0,
+                 expand_memo: t.Optional[t.Dict[tuple, t.List[dict]]] = None,
+                 expand_pruned: bool = False,
+                 related_rows: t.Optional[t.Dict[str, t.List[models.Model]]] = None):
+        self.request = request
+        self.view = view
+        self.obj = obj
+        self.only = only
+        self.expand_path = expand_path
+        self.expand_level = expand_level
+        self.expand_depth = expand_depth
+        self.expand_memo = expand_memo if expand_memo is not None else {}
+        # set if a relation was not expanded because of a cycle, i.e. schema depends on expand_path
+        self.expand_pruned = expand_pruned
+        self.related_rows = related_rows if related_rows is not None else {}
+
+    def derive(self, **kwargs) -> 'MetaDataContext':
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(kwargs)
+        return MetaDataContext(**values)
+
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    # python 3.6: contexts are activated synchronously, so thread-local storage is enough
+    class ContextVar:
+        def __init__(self, name: str, default=None):
+            self.name = name
+            self.default = default
+            self._local = threading.local()
+
+        def get(self):
+            return getattr(self._local, 'value', self.default)
+
+        def set(self, value):
+            token = self.get()
+            self._local.value = value
+            return token
+
+        def reset(self, token):
+            self._local.value = token
+
+
+_current_context = ContextVar('drf_metadata_context', default=None)
+
+
+@contextmanager
+def activate_context(context: MetaDataContext):
+    """
+    Makes context current for hooks reading self.request, self.view, self.obj
+    :param context: MetaDataContext
+    """
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+class MetaDataContextMixin:
+    """
+    Exposes current MetaDataContext values as request, view and obj attributes.
+        Values assigned directly are stored in instance own context used outside of determine_metadata calls.
+    """
+    _own_context: t.Optional[MetaDataContext] = None
+
+    @property
+    def context(self) -> MetaDataContext:
+        context = _current_context.get()
+        if context is not None:
+            return context
+        if self._own_context is None:
+            self._own_context = MetaDataContext()
+        return self._own_context
+
+    @property
+    def request(self) -> t.Optional[Request]:
+        return self.context.request
+
+    @request.setter
+    def request(self, value: t.Optional[Request]):
+        self.context.request = value
+
+    @property
+    def view(self) -> t.Optional[APIView]:
+        return self.context.view
+
+    @view.setter
+    def view(self, value: t.Optional[APIView]):
+        self.context.view = value
+
+    @property
+    def obj(self) -> t.Any:
+        return self.context.obj
+
+    @obj.setter
+    def obj(self, value: t.Any):
+        self.context.obj = value
+
+
+def freeze(value: t.Any) -> t.Any:
+    """
+    Returns read-only copy of JSON-like value: lists become tuples, dicts become mapping proxies
+    :param value: any value
+    :return: frozen value
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return MappingProxyType(OrderedDict((k, freeze(v)) for k, v in value.items()))
+    return value
+
+
+class StaticFieldMeta:
+    """
+    Read-only request-independent part of a field bundle shared between calls.
+        Nested values are frozen, so bundles built from it can't leak changes to other calls.
+        Pre-encoded JSON fragment is computed lazily on first render.
+    """
+    __slots__ = ('data', '_fragment')
+
+    def __init__(self, data: t.Mapping):
+        self.data = freeze(data)
+        self._fragment = None
+
+    @property
+    def fragment(self) -> bytes:
+        if self._fragment is None:
+            self._fragment = dumps_fragment(self.data)
+        return self._fragment
+
+
+class FieldMeta(OrderedDict):
+    """
+    Field bundle returned by MetaData and CustomMetadata: a copy-on-write overlay over the static part
+        it was built from. Renderers are able to reuse pre-encoded fragment of the static part.
+    """
+    static: t.Optional[StaticFieldMeta] = None
+
+    @classmethod
+    def from_static(cls, static: StaticFieldMeta) -> 'FieldMeta':
+        field_meta = cls(static.data)
+        field_meta.static = static
+        return field_meta
 
-class MetaData:
+    def get_static_fragment(self) -> t.Optional[bytes]:
+        """
+        Returns pre-encoded static fragment if static values were not overridden in this bundle.
+        :return: bytes or None
+        """
+        if self.static is None:
+            return None
+        for k, v in self.static.data.items():
+            if self.get(k, self) is not v:
+                return None
+        return self.static.fragment
+
+    def get_dynamic_part(self) -> OrderedDict:
+        static_data = self.static.data if self.static is not None else {}
+        return OrderedDict((k, v) for k, v in self.items() if k not in static_data)
+
+
+class MetaData(MetaDataContextMixin):
     URL_PK_PLACEHOLDER = 'object_pk'
 
     # title
     title: t.Optional[str] = None
 
-    # current obj (set in runtime)
-    obj = None
-
-    # current view (set in runtime)
-    view: t.Optional[APIView] = None
-
-    # current request sets in runtime with determine_metadata method
-    request: t.Optional[Request] = None
+    # current obj, view and request are available as self.obj, self.view and self.request
+    #   while determine_metadata result is evaluated (see MetaDataContext)
 
     # django model
     model: t.Optional[models.Model] = None
@@ -53,6 +353,10 @@ class MetaData:
     # do not include any data markers in metadata response
     no_data: t.List[str] = []
 
+    # query parameter with comma-separated names of requested fields, e.g. 'fields' for ?fields=publisher,state;
+    # disabled by default since the parameter may already be used by the view
+    fields_query_param: t.Optional[str] = None
+
     attr_list = [
         'name', 'verbose_name', 'help_text',
         'blank', 'null',
@@ -77,6 +381,67 @@ class MetaData:
     # update (patch) field dict bundles with specified data; called last
     update_fields: t.Dict[str, dict] = {}
 
+    # related datasets cache; datasets are cached only for fields with get_NAME_cache_key defined
+    cache_alias = 'default'
+    cache_timeout: t.Optional[int] = 300
+    # per-field cache timeouts {'field_name': 60}
+    cache_timeouts: t.Dict[str, t.Optional[int]] = {}
+
+    # serve expired datasets for this many seconds while a single worker refreshes them in background
+    stale_while_revalidate: t.Optional[int] = None
+    refresh_lock_timeout = 60
+    # executor running refreshes, shared thread pool by default
+    refresh_executor: t.Optional[Executor] = None
+    # on cache miss wait this many seconds for a dataset being built by another worker before building it
+    lock_wait_timeout = 5
+    lock_poll_interval = 0.05
+
+    # relations applied to field querysets {'publisher': ['owner']}
+    select_related: t.Dict[str, t.List[str]] = {}
+    prefetch_related: t.Dict[str, t.List[str]] = {}
+
+    # remember relations accessed while serializing related datasets and select_related them next time
+    auto_select_related = True
+    _learned_select_related: t.Dict[tuple, t.FrozenSet[str]] = {}
+
+    # log a warning if serializing related dataset takes more queries than expected
+    #   (1 + number of prefetch_related lookups by default); per-field limits {'publisher': 3}
+    query_count_guard = True
+    max_queries: t.Dict[str, int] = {}
+
+    # inline related data only for small datasets, bigger ones are replaced with fallback dataset urls
+    max_inline_rows: t.Optional[int] = None
+    max_inline_bytes: t.Optional[int] = None
+    fallback_dataset_urls: t.Dict[str, str] = {}
+    count_cache_timeout: t.Optional[int] = 60
+    # running average of serialized row size over the last row_size_samples non-empty datasets
+    row_size_samples = 50
+    _learned_row_sizes: t.Dict[tuple, t.Tuple[float, int]] = {}
+
+    # fetch small related datasets of several fields with a single UNION ALL query;
+    #   True batches all eligible fields, or list of field names
+    batch_related_data: t.Union[bool, t.List[str]] = False
+
+    # rows per query for NDJSON related data export
+    export_chunk_size = 1000
+
+    # related fields with related model metadata embedded into field bundle as `fields`; EXPAND_ALL expands all
+    expand: t.Union[str, t.List[str]] = []
+
+    # max nesting level of expanded related models
+    expand_depth = 1
+
+    # MetaData classes used for expanded related models {'publisher': PublisherMetaData};
+    # other expanded models are described without related datasets
+    expand_metadata: t.Dict[str, t.Type['MetaData']] = {}
+
+    # shared MetaData instances describing expanded related models
+    _expand_metadata_instances: t.Dict[tuple, 'MetaData'] = {}
+
+    # cache request-independent part of field bundles (see get_field_static_meta)
+    cache_static_meta = True
+    _static_meta_cache: t.Dict[tuple, StaticFieldMeta] = {}
+
     # noinspection PyPep8Naming,PyMethodMayBeStatic
     def get_NAME_serializer(self, field: models.Field, qs: models.QuerySet, obj=None) -> Serializer:
         """
@@ -130,6 +495,30 @@ class MetaData:
         """
         raise Exception()
 
+    # noinspection PyPep8Naming,PyMethodMayBeStatic
+    def get_NAME_cache_key(self, field: models.Field, request: t.Optional[Request], obj=None) -> t.Optional[str]:
+        """
+        Enables caching of field <NAME> related dataset. Returned key must scope the dataset
+            the same way get_NAME_queryset does (tenant, role, etc.), None disables caching for this call.
+            This method (`get_NAME_cache_key`) is not supposed to use directly.
+        :param field: model field
+        :param request: current request
+        :param obj: optional obj passed to method
+        :return: str or None
+        """
+        raise Exception()
+
+    # noinspection PyPep8Naming,PyMethodMayBeStatic
+    def get_NAME_fallback_dataset_url(self, field: models.Field, obj=None) -> str:
+        """
+        Returns dataset url used instead of inline data if dataset exceeds max_inline_rows or max_inline_bytes.
+            This method (`get_NAME_fallback_dataset_url`) is not supposed to use directly.
+        :param field:
+        :param obj: optional obj passed to method
+        :return: str
+        """
+        raise Exception()
+
     # noinspection PyProtectedMember
     def get_field_related_model(self, field_name: str) -> models.Model:
         return self.model._meta.get_field(field_name).related_model
@@ -187,15 +576,562 @@ class MetaData:
         serializer = self.get_serializer(field)
         return serializer(qs, many=True).data
 
-    def get_field_related_data(self, field):
+    def get_cache_timeout(self, field: models.Field) -> t.Optional[int]:
+        return self.cache_timeouts.get(field.name, self.cache_timeout)
+
+    # noinspection PyProtectedMember
+    def get_related_data_cache_key(self, field: models.Field) -> t.Optional[str]:
+        get_cache_key_method = getattr(self, 'get_%s_cache_key' % field.name, None)
+        if not callable(get_cache_key_method):
+            return None
+
+        user_key = get_cache_key_method(field, self.request, self.obj)
+        if user_key is None:
+            return None
+
+        related_model = self.get_field_related_model(field.name)
+        version = get_related_data_version(related_model, self.cache_alias)
+        key = ':'.join([
+            self.__class__.__module__, self.__class__.__qualname__, field.model._meta.label_lower, field.name,
+            str(get_language()), force_text(user_key),
+        ])
+        return '%s:%s:v%s' % (RELATED_DATA_CACHE_PREFIX, hashlib.md5(key.encode()).hexdigest(), version)
+
+    @staticmethod
+    def get_last_known_cache_key(cache_key: str) -> str:
+        # versionless key; keeps the last dataset available after invalidate_related_data
+        return cache_key.rsplit(':', 1)[0] + ':last'
+
+    def get_max_queries(self, field: models.Field) -> int:
+        if field.name in self.max_queries:
+            return self.max_queries[field.name]
+        return 1 + len(self.prefetch_related.get(field.name, []))
+
+    @staticmethod
+    def has_deferred_fields(qs: models.QuerySet) -> bool:
+        # select_related() can't traverse fields deferred with only()/defer()
+        return qs.query.deferred_loading != (frozenset(), True)
+
+    def learn_select_related(self, field: models.Field, qs: t.Union[models.QuerySet, t.List[models.Model]]):
+        if isinstance(qs, models.QuerySet) and self.has_deferred_fields(qs):
+            return
+
+        result_cache = qs if isinstance(qs, list) else getattr(qs, '_result_cache', None)
+        if not result_cache or not isinstance(result_cache[0], models.Model):
+            return
+
+        key = (self.__class__, field)
+        learned = self._learned_select_related.get(key, frozenset())
+        relations = set()
+        for item in result_cache:
+            relations |= get_loaded_relations(item)
+        if not relations <= learned:
+            self._learned_select_related[key] = learned | relations
+
+    def serialize_related_data(self, field: models.Field, qs: t.Union[models.QuerySet, t.List[models.Model]]):
+        if isinstance(qs, list):
+            db = qs[0]._state.db if qs else None
+        else:
+            db = qs.db if isinstance(qs, models.QuerySet) else None
+
+        if not self.query_count_guard or db is None:
+            return self.serialize_queryset(field, qs)
+
+        counter = QueryCounter()
+        with connections[db].execute_wrapper(counter):
+            data = self.serialize_queryset(field, qs)
+
+        max_queries = self.get_max_queries(field)
+        if counter.count > max_queries:
+            logger.warning(
+                '%s: serializing `%s` related data took %s queries, expected at most %s. '
+                'Declare select_related/prefetch_related for this field.',
+                self.__class__.__name__, field.name, counter.count, max_queries
+            )
+        return data
+
+    def build_field_related_data(self, field: models.Field):
+        # rows fetched by fetch_batched_related_data
+        qs = self.context.related_rows.get(field.name)
+        if qs is None:
+            qs = self.get_field_queryset(field)
+
+        try:
+            data = self.serialize_related_data(field, qs)
+        except FieldError:
+            # learned lookups select_related() can't follow must not break the field for the process lifetime
+            if not self._learned_select_related.pop((self.__class__, field), None):
+                raise
+            logger.warning(
+                '%s: learned select_related lookups of `%s` are invalid, dropped', self.__class__.__name__, field.name
+            )
+            qs = self.get_field_queryset(field)
+            data = self.serialize_related_data(field, qs)
+
+        if self.auto_select_related:
+            self.learn_select_related(field, qs)
+        return data
+
+    def get_batched_fields(self, fields: t.List[models.Field]) -> t.List[models.Field]:
+        """
+        Returns fields with inline related data that is neither cached nor replaced with urls
+        :param fields: fields being described
+        :return: list of fields
+        """
+        if not self.batch_related_data:
+            return []
+
+        batched_fields = []
+        for f in fields:
+            if not f.related_model or f.name in self.no_data or f.name in self.dataset_urls:
+                continue
+            if self.batch_related_data is not True and f.name not in self.batch_related_data:
+                continue
+            if any(callable(getattr(self, method_name % f.name, None)) for method_name in [
+                'get_%s_field_meta', 'get_%s_dataset_url', 'get_%s_cache_key'
+            ]):
+                continue
+            if self.max_inline_rows is not None or self.max_inline_bytes is not None:
+                if self.get_fallback_dataset_url(f) is not None:
+                    continue
+            batched_fields.append(f)
+        return batched_fields
+
+    # internal types of columns restored from JSON objects with Field.to_python exactly as db converters do
+    batchable_internal_types = {
+        'AutoField', 'BigAutoField', 'SmallAutoField',
+        'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+        'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+        'CharField', 'TextField', 'SlugField', 'BooleanField', 'NullBooleanField',
+        'DateField', 'FloatField', 'UUIDField',
+    }
+
+    # max arguments of JSON object function by database vendor: JSONB_BUILD_OBJECT, json_object
+    json_object_max_args = {'postgresql': 100, 'sqlite': 127}
+
+    @classmethod
+    def is_batchable_field(cls, field: models.Field) -> bool:
+        # fields with from_db_value (JSONField, custom fields) need db converters skipped by batching
+        if hasattr(field, 'from_db_value'):
+            return False
+        if field.is_relation:
+            return cls.is_batchable_field(field.target_field)
+        return field.get_internal_type() in cls.batchable_internal_types
+
+    # noinspection PyProtectedMember
+    @classmethod
+    def is_batchable_queryset(cls, qs: models.QuerySet) -> bool:
+        if not isinstance(qs, models.QuerySet) or qs._iterable_class is not ModelIterable:
+            return False
+        concrete_fields = qs.model._meta.concrete_fields
+        if not all(cls.is_batchable_field(cf) for cf in concrete_fields):
+            return False
+
+        query = qs.query
+        if query.combinator or query.distinct or query.low_mark or query.high_mark is not None:
+            return False
+        if query.select_related or qs._prefetch_related_lookups:
+            return False
+        if query.annotations or query.extra or query.deferred_loading != (frozenset(), True):
+            return False
+
+        connection = connections[qs.db]
+        # JSON object function takes name and value argument per column
+        max_args = cls.json_object_max_args.get(connection.vendor)
+        if max_args is not None and len(concrete_fields) * 2 > max_args:
+            return False
+
+        features = connection.features
+        return features.supports_over_clause and getattr(features, 'has_json_object_function', False)
+
+    # noinspection PyProtectedMember
+    @staticmethod
+    def get_batch_ordering(qs: models.QuerySet) -> t.List:
+        query = qs.query
+        ordering = query.order_by or (query.default_ordering and qs.model._meta.ordering) or ['pk']
+        expressions = []
+        for item in ordering:
+            if not isinstance(item, str):
+                expressions.append(item)
+            elif item.startswith('-'):
+                expressions.append(F(item[1:]).desc())
+            elif item != '?':
+                expressions.append(F(item).asc())
+        return expressions
+
+    # noinspection PyProtectedMember
+    def fetch_batched_related_data(self, fields: t.List[models.Field]) -> t.Dict[str, t.List[models.Model]]:
+        """
+        Fetches querysets of fields with one UNION ALL query per database. Every branch selects field tag,
+            row position in queryset ordering and JSON object of concrete columns; instances are rebuilt
+            with Model.from_db. Querysets with select_related, annotations, slicing, etc. and models with columns
+            not surviving JSON round trip (decimals, durations, JSON, binary data) are not batched.
+        :param fields: fields returned by get_batched_fields
+        :return: {'field_name': [instance1, instance2, ...]}
+        """
+        # django >= 3.2
+        from django.db.models.functions import JSONObject
+
+        branches_by_db = OrderedDict()
+        for i, f in enumerate(fields):
+            qs = self.get_field_queryset(f)
+            if not self.is_batchable_queryset(qs):
+                continue
+
+            concrete_fields = qs.model._meta.concrete_fields
+            branch = qs.order_by().annotate(
+                _drf_metadata_tag=Value(i),
+                _drf_metadata_pos=Window(RowNumber(), order_by=self.get_batch_ordering(qs)),
+                _drf_metadata_row=JSONObject(**{cf.attname: cf.attname for cf in concrete_fields}),
+            ).values_list('_drf_metadata_tag', '_drf_metadata_pos', '_drf_metadata_row')
+            branches_by_db.setdefault(qs.db, []).append((i, f, qs.model, branch))
+
+        related_rows = {}
+        for db, branches in branches_by_db.items():
+            if len(branches) < 2:
+                continue
+
+            first_branch = branches[0][3]
+            rows_by_tag = {}
+            for tag, pos, row in first_branch.union(*[branch for *_, branch in branches[1:]], all=True):
+                rows_by_tag.setdefault(tag, []).append((pos, json.loads(row) if isinstance(row, str) else row))
+
+            for i, f, model, _ in branches:
+                concrete_fields = model._meta.concrete_fields
+                field_names = [cf.attname for cf in concrete_fields]
+                related_rows[f.name] = [
+                    model.from_db(db, field_names, [cf.to_python(row.get(cf.attname)) for cf in concrete_fields])
+                    for _, row in sorted(rows_by_tag.get(i, []), key=lambda pos_row: pos_row[0])
+                ]
+
+        return related_rows
+
+    # noinspection PyProtectedMember
+    @staticmethod
+    def is_exportable_queryset(qs: models.QuerySet) -> bool:
+        # keyset pagination re-orders, filters and slices queryset by primary key
+        if not isinstance(qs, models.QuerySet) or qs._iterable_class is not ModelIterable:
+            return False
+        query = qs.query
+        return not (query.combinator or query.low_mark or query.high_mark is not None)
+
+    def iter_field_queryset_chunks(self, field: models.Field,
+                                   chunk_size: int) -> t.Generator[t.List[models.Model], None, None]:
+        """
+        Walks field queryset with keyset pagination over primary key
+        :param field: model field
+        :param chunk_size: rows per query
+        :return: generator of model instance lists
+        """
         qs = self.get_field_queryset(field)
-        return self.serialize_queryset(field, qs)
+        if not self.is_exportable_queryset(qs):
+            raise ValueError('`%s` queryset can not be exported' % field.name)
+
+        qs = qs.order_by('pk')
+        last_pk = None
+        while True:
+            chunk_qs = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+            chunk = list(chunk_qs[:chunk_size])
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_pk = chunk[-1].pk
+
+    def stream_field_related_data(self,
+                                  field: models.Field,
+                                  chunk_size: t.Optional[int] = None,
+                                  context: t.Optional[MetaDataContext] = None) -> t.Generator[bytes, None, None]:
+        """
+        Serializes whole field related dataset chunk by chunk with field serializer
+        :param field: model field
+        :param chunk_size: rows per query, export_chunk_size by default
+        :param context: call context activated while chunks are fetched and serialized
+        :return: generator of newline-delimited JSON chunks
+        """
+        context = context or self.context
+        chunks = self.iter_field_queryset_chunks(field, chunk_size or self.export_chunk_size)
+        while True:
+            with activate_context(context):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                lines = [dumps(item) + b'\n' for item in self.serialize_queryset(field, chunk)]
+            yield b''.join(lines)
+
+    # noinspection PyProtectedMember
+    def export_field_data(self,
+                          request: Request,
+                          field_name: str,
+                          view: t.Optional[APIView]=None,
+                          obj: t.Any=None,
+                          chunk_size: t.Optional[int]=None) -> StreamingHttpResponse:
+        """
+        Returns streaming NDJSON response with whole related dataset of field
+        :param request: current request
+        :param field_name: name of related field
+        :param view: current view
+        :param obj: optional obj passed to hooks
+        :param chunk_size: rows per query, export_chunk_size by default
+        :return: StreamingHttpResponse
+        """
+        # only datasets this MetaData would describe are exported
+        field = next((f for f in self.get_selected_fields() if f.name == field_name), None)
+        if field is None or not field.related_model or field.name in self.no_data:
+            raise ValueError('`%s` is not an exportable relation field' % field_name)
+
+        context = MetaDataContext(request, view, obj)
+        with activate_context(context):
+            context.obj = obj or self.get_obj(request, view)
+            # checked before response is started; lists, sliced and combined querysets can't be walked by pk
+            if not self.is_exportable_queryset(self.get_field_queryset(field)):
+                raise ValueError('`%s` is not an exportable relation field' % field_name)
+
+        return StreamingHttpResponse(
+            self.stream_field_related_data(field, chunk_size, context), content_type='application/x-ndjson'
+        )
+
+    # noinspection PyProtectedMember
+    @staticmethod
+    def estimate_count(qs: models.QuerySet) -> t.Optional[int]:
+        """
+        Returns planner row estimate for unfiltered querysets (PostgreSQL only)
+        :param qs: queryset
+        :return: int or None if there's no estimate
+        """
+        connection = connections[qs.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        query = qs.query
+        if query.where or query.distinct or query.combinator or query.low_mark or query.high_mark is not None:
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)',
+                [connection.ops.quote_name(qs.model._meta.db_table)]
+            )
+            row = cursor.fetchone()
+
+        if not row or row[0] <= 0:
+            return None
+        return int(row[0])
+
+    def get_dataset_count(self, field: models.Field) -> int:
+        """
+        Returns cheap related dataset size: planner estimate or count() cached for count_cache_timeout
+        :param field: model field
+        :return: int
+        """
+        qs = self.get_field_queryset(field)
+        if not isinstance(qs, models.QuerySet):
+            return len(qs)
+
+        estimate = self.estimate_count(qs)
+        if estimate is not None:
+            return estimate
+
+        try:
+            sql = str(qs.query)
+        except EmptyResultSet:
+            return 0
+
+        cache = caches[self.cache_alias]
+        cache_key = '%s:count:%s' % (RELATED_DATA_CACHE_PREFIX, hashlib.md5((qs.db + sql).encode()).hexdigest())
+        count = cache.get(cache_key)
+        if count is None:
+            count = qs.count()
+            cache.set(cache_key, count, self.count_cache_timeout)
+        return count
+
+    def get_fallback_dataset_url(self, field: models.Field) -> t.Optional[str]:
+        user_url_getter = getattr(self, 'get_%s_fallback_dataset_url' % field.name.lower(), None)
+        if callable(user_url_getter):
+            return user_url_getter(field, self.obj)
+        if field.name in self.fallback_dataset_urls:
+            return force_text(self.fallback_dataset_urls[field.name])
+        return None
+
+    def is_dataset_too_large(self, field: models.Field) -> bool:
+        count = self.get_dataset_count(field)
+        if self.max_inline_rows is not None and count > self.max_inline_rows:
+            return True
+
+        learned = self._learned_row_sizes.get((self.__class__, field))
+        if self.max_inline_bytes is not None and learned is not None:
+            return count * learned[0] > self.max_inline_bytes
+
+        return False
+
+    def learn_row_size(self, field: models.Field, size: int, rows: int):
+        if not rows:
+            return
+
+        key = (self.__class__, field)
+        row_size, samples = self._learned_row_sizes.get(key, (0.0, 0))
+        samples = min(samples + 1, self.row_size_samples)
+        self._learned_row_sizes[key] = (row_size + (size / rows - row_size) / samples, samples)
+
+    def get_field_data(self, field: models.Field):
+        """
+        Returns inline related data or fallback dataset url if dataset is too large to inline
+        :param field: model field
+        :return: serialized dataset or url
+        """
+        fallback_url = self.get_fallback_dataset_url(field)
+        if fallback_url is None or (self.max_inline_rows is None and self.max_inline_bytes is None):
+            return self.get_field_related_data(field)
+
+        if self.is_dataset_too_large(field):
+            return fallback_url
+
+        data, size = self.get_field_related_data_entry(field)
+        if size is not None and size > self.max_inline_bytes:
+            return fallback_url
+        return data
+
+    def measure_related_data(self, field: models.Field, data) -> t.Optional[int]:
+        """
+        Returns serialized size of freshly built dataset and updates row size estimate.
+            Only datasets that may be replaced with fallback url by max_inline_bytes are measured.
+        :param field: model field
+        :param data: serialized dataset
+        :return: size in bytes or None if dataset is not measured
+        """
+        if self.max_inline_bytes is None or self.get_fallback_dataset_url(field) is None:
+            return None
+
+        size = len(dumps(data))
+        self.learn_row_size(field, size, len(data))
+        return size
+
+    def build_related_data_entry(self, field: models.Field) -> RelatedDataEntry:
+        data = self.build_field_related_data(field)
+        return RelatedDataEntry(data, self.measure_related_data(field, data))
+
+    def set_cached_related_data(self, field: models.Field, cache_key: str, data, size: t.Optional[int] = None):
+        """
+        Caches dataset with its freshness deadline; stale datasets are kept for stale_while_revalidate seconds
+        :param field: model field
+        :param cache_key: related data cache key
+        :param data: serialized dataset
+        :param size: serialized dataset size, if measured
+        """
+        timeout = self.get_cache_timeout(field)
+        if timeout is None:
+            fresh_until = None
+        else:
+            fresh_until = time.time() + timeout
+            timeout += self.stale_while_revalidate or 0
+
+        cache = caches[self.cache_alias]
+        cache.set(cache_key, (data, fresh_until, size), timeout)
+        if self.stale_while_revalidate:
+            cache.set(self.get_last_known_cache_key(cache_key), (data, size), timeout)
+
+    def refresh_field_related_data(self,
+                                   field: models.Field,
+                                   cache_key: str,
+                                   language: t.Optional[str],
+                                   context: MetaDataContext):
+        try:
+            with override(language), activate_context(context):
+                entry = self.build_related_data_entry(field)
+            self.set_cached_related_data(field, cache_key, *entry)
+        except Exception:
+            logger.exception('%s: failed to refresh `%s` related data', self.__class__.__name__, field.name)
+        finally:
+            caches[self.cache_alias].delete(cache_key + ':lock')
+            close_old_connections()
+
+    def schedule_refresh(self, field: models.Field, cache_key: str) -> t.Optional[Future]:
+        """
+        Schedules background dataset refresh unless another worker is refreshing it already
+        :param field: model field
+        :param cache_key: related data cache key
+        :return: Future or None if the lock is taken
+        """
+        if not caches[self.cache_alias].add(cache_key + ':lock', 1, self.refresh_lock_timeout):
+            return None
+
+        executor = self.refresh_executor or get_refresh_executor()
+        return executor.submit(self.refresh_field_related_data, field, cache_key, get_language(), self.context)
+
+    def build_cached_related_data(self, field: models.Field, cache_key: str) -> RelatedDataEntry:
+        """
+        Builds and caches missing dataset; only one worker builds it, others wait for its result
+            up to lock_wait_timeout seconds
+        :param field: model field
+        :param cache_key: related data cache key
+        :return: RelatedDataEntry
+        """
+        cache = caches[self.cache_alias]
+        lock_key = cache_key + ':lock'
+        if not cache.add(lock_key, 1, self.refresh_lock_timeout):
+            deadline = time.time() + self.lock_wait_timeout
+            while time.time() < deadline:
+                time.sleep(self.lock_poll_interval)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return RelatedDataEntry(cached[0], cached[2])
+            logger.warning(
+                '%s: timed out waiting for `%s` related data, building it', self.__class__.__name__, field.name
+            )
+            entry = self.build_related_data_entry(field)
+            self.set_cached_related_data(field, cache_key, *entry)
+            return entry
+
+        try:
+            entry = self.build_related_data_entry(field)
+            self.set_cached_related_data(field, cache_key, *entry)
+            return entry
+        finally:
+            cache.delete(lock_key)
+
+    def get_field_related_data_entry(self, field: models.Field) -> RelatedDataEntry:
+        """
+        Returns related dataset with its serialized size measured when dataset was built
+        :param field: model field
+        :return: RelatedDataEntry
+        """
+        cache_key = self.get_related_data_cache_key(field)
+        if cache_key is None:
+            return self.build_related_data_entry(field)
+
+        cached = caches[self.cache_alias].get(cache_key)
+        if cached is None:
+            if self.stale_while_revalidate:
+                # dataset was invalidated; serve the last known one while it's rebuilt
+                last_known = caches[self.cache_alias].get(self.get_last_known_cache_key(cache_key))
+                if last_known is not None:
+                    self.schedule_refresh(field, cache_key)
+                    return RelatedDataEntry(*last_known)
+            return self.build_cached_related_data(field, cache_key)
+
+        data, fresh_until, size = cached
+        if fresh_until is not None and fresh_until <= time.time() and self.stale_while_revalidate:
+            self.schedule_refresh(field, cache_key)
+        return RelatedDataEntry(data, size)
+
+    def get_field_related_data(self, field: models.Field):
+        return self.get_field_related_data_entry(field).data
 
     # noinspection PyProtectedMember
-    def get_meta(self) -> t.Generator[t.Dict, None, None]:
+    def get_selected_fields(self) -> t.List[models.Field]:
+        """
+        Returns model fields described by this MetaData; computed once per instance
+        :return: list of fields
+        """
+        selected_fields = self.__dict__.get('_selected_fields')
+        if selected_fields is not None:
+            return selected_fields
+
+        self.resolve_model()
         all_fields = self.model._meta.get_fields(
             include_parents=self.include_parents, include_hidden=self.include_hidden
         )
+        selected_fields = []
         for f in all_fields:
             if f.name in self.exclude:
                 continue
@@ -210,22 +1146,68 @@ class MetaData:
                 if f.editable not in self.editable_in:
                     continue
 
-            yield self.get_field_meta(f)
+            selected_fields.append(f)
+
+        self.__dict__['_selected_fields'] = selected_fields
+        return selected_fields
+
+    def get_meta(self, context: t.Optional[MetaDataContext] = None) -> t.Generator[t.Dict, None, None]:
+        """
+        :param context: call context activated while each field bundle is built
+        :return: generator of field bundles
+        """
+        context = context or self.context
+        fields = [f for f in self.get_selected_fields() if context.only is None or f.name in context.only]
+
+        batched_fields = self.get_batched_fields(fields)
+        if batched_fields:
+            with activate_context(context):
+                context.related_rows = self.fetch_batched_related_data(batched_fields)
+
+        for f in fields:
+            with activate_context(context):
+                field_meta = self.get_field_meta(f)
+            yield field_meta
+
+    # noinspection PyProtectedMember
+    def plan_queryset(self, field: models.Field, qs: models.QuerySet) -> models.QuerySet:
+        """
+        Applies declared and learned select_related/prefetch_related lookups to field queryset
+        :param field: model field
+        :param qs: queryset
+        :return: QuerySet()
+        """
+        if not isinstance(qs, models.QuerySet) or qs._iterable_class is not ModelIterable or qs.query.combinator:
+            return qs
+
+        select_related = set(self.select_related.get(field.name, []))
+        if self.auto_select_related and not self.has_deferred_fields(qs):
+            select_related |= self._learned_select_related.get((self.__class__, field), frozenset())
+        if select_related:
+            qs = qs.select_related(*sorted(select_related))
+
+        prefetch_related = self.prefetch_related.get(field.name)
+        if prefetch_related:
+            qs = qs.prefetch_related(*prefetch_related)
+
+        return qs
 
     def get_field_queryset(self, field: models.Field) -> models.QuerySet:
         custom_queryset_method = getattr(self, 'get_%s_queryset' % field.name.lower(), None)
         if custom_queryset_method is not None:
-            return custom_queryset_method(field)
+            qs = custom_queryset_method(field)
+        else:
+            model = self.get_field_related_model(field.name)
+            qs = model.objects.all()
 
-        model = self.get_field_related_model(field.name)
-        return model.objects.all()
-
-    def get_field_meta(self, field: models.Field) -> OrderedDict:
-        # check if we need to override default get_field_meta behaviour
-        get_field_meta = getattr(self, 'get_%s_field_meta' % field.name, None)
-        if callable(get_field_meta):
-            return get_field_meta(field, self.obj)
+        return self.plan_queryset(field, qs)
 
+    def build_field_static_meta(self, field: models.Field) -> OrderedDict:
+        """
+        Builds the part of field bundle that does not depend on request, view or obj.
+        :param field: Django models.Field instance
+        :return: OrderedDict
+        """
         sentinel = object()
         d = OrderedDict()
 
@@ -237,21 +1219,98 @@ class MetaData:
                 if val is None:
                     continue
 
-            if attr in ['verbose_name']:
+            if attr in ['verbose_name'] or isinstance(val, Promise):
                 val = force_text(val)
 
             d[attr] = val
 
         d['type'] = field.get_internal_type()
         d['required'] = self.is_required(field)
-        if field.default != models.NOT_PROVIDED:
-            if callable(field.default):
-                d['default'] = field.default()
-            else:
-                d['default'] = field.default
+        if field.default != models.NOT_PROVIDED and not callable(field.default):
+            d['default'] = field.default
         if hasattr(field, 'choices') and field.choices:
             d['choices'] = list(self.format_choices(field))
 
+        return d
+
+    def get_field_static_meta(self, field: models.Field) -> StaticFieldMeta:
+        if not self.cache_static_meta:
+            return StaticFieldMeta(self.build_field_static_meta(field))
+
+        key = (self.__class__, field, get_language())
+        static = self._static_meta_cache.get(key)
+        if static is None:
+            static = StaticFieldMeta(self.build_field_static_meta(field))
+            self._static_meta_cache[key] = static
+        return static
+
+    def is_expanded(self, field: models.Field) -> bool:
+        return self.expand == EXPAND_ALL or field.name in self.expand
+
+    def get_expand_metadata(self, field: models.Field) -> 'MetaData':
+        """
+        Returns MetaData instance describing field's related model. Without expand_metadata entry
+            only schema is described: nested datasets would not be scoped the way get_NAME_queryset scopes field.
+        :param field: Django models.Field instance
+        :return: MetaData
+        """
+        metadata_class = self.expand_metadata.get(field.name)
+        if metadata_class is not None:
+            return metadata_class()
+
+        metadata = MetaData()
+        metadata.model = field.related_model
+        metadata.expand = EXPAND_ALL
+        metadata.no_data = [f.name for f in field.related_model._meta.get_fields() if f.related_model]
+        return metadata
+
+    def get_expanded_field_meta(self, field: models.Field) -> t.Optional[t.List[dict]]:
+        """
+        Returns field bundles of field's related model; schemas are computed once per determine_metadata call.
+            Schemas with cycles pruned depend on the path they were reached by, so they are not memoized.
+        :param field: Django models.Field instance
+        :return: list of field bundles or None if nesting is too deep or cycle is detected
+        """
+        context = self.context
+        if context.expand_level >= context.expand_depth:
+            return None
+        if field.related_model in context.expand_path:
+            context.expand_pruned = True
+            return None
+
+        key = (self.__class__, field)
+        metadata = self._expand_metadata_instances.get(key)
+        if metadata is None:
+            metadata = self.get_expand_metadata(field)
+            metadata.resolve_model()
+            self._expand_metadata_instances[key] = metadata
+
+        memo_key = (metadata.__class__, metadata.model, context.expand_depth - context.expand_level - 1)
+        if memo_key in context.expand_memo:
+            return context.expand_memo[memo_key]
+
+        nested_context = context.derive(
+            obj=None, only=None, related_rows={}, expand_pruned=False,
+            expand_path=context.expand_path + (metadata.model,), expand_level=context.expand_level + 1
+        )
+        expanded_field_meta = list(metadata.get_meta(nested_context))
+        if nested_context.expand_pruned:
+            context.expand_pruned = True
+        else:
+            context.expand_memo[memo_key] = expanded_field_meta
+        return expanded_field_meta
+
+    def get_field_meta(self, field: models.Field) -> FieldMeta:
+        # check if we need to override default get_field_meta behaviour
+        get_field_meta = getattr(self, 'get_%s_field_meta' % field.name, None)
+        if callable(get_field_meta):
+            return get_field_meta(field, self.obj)
+
+        d = FieldMeta.from_static(self.get_field_static_meta(field))
+
+        if field.default != models.NOT_PROVIDED and callable(field.default):
+            d['default'] = field.default()
+
         if field.related_model:
             if field.name not in self.no_data:
                 user_url_getter = getattr(self, 'get_%s_dataset_url' % field.name.lower(), None)
@@ -260,7 +1319,12 @@ class MetaData:
                 elif field.name in self.dataset_urls:
                     d['data'] = force_text(self.dataset_urls[field.name])
                 else:
-                    d['data'] = self.get_field_related_data(field)
+                    d['data'] = self.get_field_data(field)
+
+            if self.is_expanded(field):
+                expanded_field_meta = self.get_expanded_field_meta(field)
+                if expanded_field_meta is not None:
+                    d['fields'] = expanded_field_meta
 
         data_update = self.update_fields.get(field.name, {})
         d.update(data_update)
@@ -283,20 +1347,73 @@ class MetaData:
                   obj: t.Optional[t.Any]=None) -> str:
         return self.title or self.model._meta.verbose_name
 
-    def determine_metadata(self, request: Request, view: t.Optional[APIView]=None, obj: t.Any=None):
-        self.request = request
-        self.view = view
-        self.obj = obj or self.get_obj(request, view)
-
+    def resolve_model(self):
         if isinstance(self.model, str):
             # noinspection PyUnresolvedReferences
             self.model = django.apps.apps.get_model(*self.model.split('.'))
 
+    def get_only(self, request: t.Optional[Request]) -> t.Optional[t.List[str]]:
+        """
+        Returns requested fields subset from request query parameters
+        :param request: current request
+        :return: list of field names or None if all fields are requested
+        :raises ValidationError: if unknown fields are requested
+        """
+        if not self.fields_query_param or request is None:
+            return None
+
+        query_params = getattr(request, 'query_params', None)
+        if query_params is None:
+            query_params = getattr(request, 'GET', {})
+
+        value = query_params.get(self.fields_query_param)
+        if not value:
+            return None
+
+        only = [name.strip() for name in value.split(',') if name.strip()]
+        unknown_fields = self.get_unknown_fields(only)
+        if unknown_fields:
+            raise ValidationError({self.fields_query_param: ['Unknown fields: %s' % ', '.join(unknown_fields)]})
+        return only
+
+    def get_unknown_fields(self, names: t.Iterable[str]) -> t.List[str]:
+        field_names = {f.name for f in self.get_selected_fields()}
+        return [name for name in names if name not in field_names]
+
+    def determine_metadata(self,
+                           request: Request,
+                           view: t.Optional[APIView]=None,
+                           obj: t.Any=None,
+                           only: t.Optional[t.Iterable[str]]=None):
+        """
+        :param request: current request
+        :param view: current view
+        :param obj: optional obj passed to hooks
+        :param only: names of fields to describe; read from `fields_query_param` if not passed.
+            Other fields are skipped before any per-field work.
+        :return: dict
+        :raises ValueError: if `only` has unknown fields
+        """
+        self.resolve_model()
+        if only is not None:
+            unknown_fields = self.get_unknown_fields(only)
+            if unknown_fields:
+                raise ValueError('Unknown fields: %s' % ', '.join(unknown_fields))
+        context = MetaDataContext(
+            request, view, obj,
+            only=list(only) if only is not None else self.get_only(request),
+            expand_path=(self.model,), expand_depth=self.expand_depth,
+        )
+        # get_obj and get_title may read self.request, self.view, self.obj
+        with activate_context(context):
+            context.obj = obj or self.get_obj(request, view)
+            title = self.get_title(request, view, obj)
+
         # noinspection PyProtectedMember,PyUnresolvedReferences
         return {
-            'title': self.get_title(request, view, obj),
+            'title': title,
             'description': view.get_view_description() if view else '',
-            'fields': self.get_meta(),
+            'fields': self.get_meta(context),
         }
 
 
@@ -336,18 +1453,18 @@ class AbstractField(dict):
             self[k] = v
 
 
-class CustomMetadata:
+class CustomMetadata(MetaDataContextMixin):
     """
     Metadata class for non-model forms
     """
-    obj = None
-    view = None
     fields = []
     order = []
-    request = None
     title = None
     action_name = None
 
+    # read-only field bundles built from `fields` {(class, language): (fields, {'name': StaticFieldMeta})}
+    _base_fields_cache: t.Dict[tuple, tuple] = {}
+
     # noinspection PyPep8Naming
     def get_NAME(self, request: Request) -> dict:
         """
@@ -363,34 +1480,61 @@ class CustomMetadata:
     def get_field_NAME(self, request: Request) -> dict:
         raise Exception()
 
-    def get_meta(self) -> t.Generator[t.Dict, None, None]:
+    def get_base_fields(self) -> t.Dict[str, StaticFieldMeta]:
+        """
+        Returns read-only bundles of `fields`; built once per class and language, never modified in runtime
+        :return: {'name': StaticFieldMeta}
         """
+        key = (self.__class__, get_language())
+        cached = self._base_fields_cache.get(key)
+        if cached is not None and cached[0] is self.fields:
+            return cached[1]
+
+        base_fields = OrderedDict()
+        for field_data in self.fields:
+            data = OrderedDict(
+                (k, force_text(v) if isinstance(v, Promise) else v) for k, v in field_data.items()
+            )
+            base_fields[field_data['name']] = StaticFieldMeta(data)
+
+        self._base_fields_cache[key] = (self.fields, base_fields)
+        return base_fields
+
+    def get_meta(self, context: t.Optional[MetaDataContext] = None) -> t.Generator[t.Dict, None, None]:
+        """
+        :param context: call context activated while field bundles are built
         :return: generator
         list(metadata_obj.get_meta()) -> [abstract_field_obj1, abstract_field_obj2, ...]
         """
-        fields_by_name = OrderedDict()
-        for field_data in self.fields:
-            fields_by_name[field_data['name']] = field_data
+        context = context or self.context
+        fields_by_name = OrderedDict(self.get_base_fields())
 
-        for k, v_callable in self.__class__.__dict__.items():
-            # method `get_field_<NAME>` used for updates later
-            if k.startswith('get_field_'):  # get_field_ обновляет существующее поле
-                continue
-            if not k.startswith('get_'):
-                continue
-            # check dynamic get_%s fields
-            # method get_%s must return {'name': '<NAME>'}, where <name> is a real field name
-            res = v_callable(self, self.request)
-            fields_by_name[res['name']] = res
+        with activate_context(context):
+            for k, v_callable in self.__class__.__dict__.items():
+                # method `get_field_<NAME>` used for updates later
+                if k.startswith('get_field_'):  # get_field_ обновляет существующее поле
+                    continue
+                if not k.startswith('get_'):
+                    continue
+                # check dynamic get_%s fields
+                # method get_%s must return {'name': '<NAME>'}, where <name> is a real field name
+                res = v_callable(self, context.request)
+                fields_by_name[res['name']] = res
 
         fields_order = self.order or fields_by_name.keys()
 
         for field_name in fields_order:
-            field_value = fields_by_name[field_name]
+            field_data = fields_by_name[field_name]
+            if isinstance(field_data, StaticFieldMeta):
+                field_value = FieldMeta.from_static(field_data)
+            else:
+                field_value = FieldMeta(field_data)
+
             # method should update field with returned dict
             method = getattr(self, 'get_field_%s' % field_name, None)
             if callable(method):
-                field_value.update(method(field_name, self.request))
+                with activate_context(context):
+                    field_value.update(method(field_name, context.request))
 
             yield field_value
 
@@ -406,13 +1550,15 @@ class CustomMetadata:
         return self.title or ''
 
     def determine_metadata(self, request: Request, view: t.Optional[APIView]=None, obj: t.Any=None) -> dict:
-        self.request = request
-        self.view = view
-        self.obj = obj or self.get_obj(request, view)
-        # self.view = view
+        context = MetaDataContext(request, view, obj)
+        # get_obj and get_title may read self.request, self.view, self.obj
+        with activate_context(context):
+            context.obj = obj or self.get_obj(request, view)
+            title = self.get_title(request, view, obj)
+
         return {
-            'title': self.get_title(request, view, obj),
+            'title': title,
             'action_name': self.action_name or 'OK',
             'description': view.get_view_description() if view else '',
-            'fields': self.get_meta(),
+            'fields': self.get_meta(context),
         }
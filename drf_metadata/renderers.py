@@ -0,0 +1,44 @@
+import typing as t
+
+from rest_framework.renderers import JSONRenderer
+
+from drf_metadata.encoding import dumps, dumps_fragment, join_fragments
+from drf_metadata.meta import FieldMeta
+
+
+class MetaDataJSONRenderer(JSONRenderer):
+    """
+    JSON renderer for MetaData responses. Static parts of field bundles are taken pre-encoded,
+        only dynamic parts (`data`, callable defaults, updates) are encoded per response.
+        Falls back to default JSONRenderer for non-metadata data and indented output.
+    """
+
+    @staticmethod
+    def render_field(field_meta: t.Any) -> bytes:
+        if isinstance(field_meta, FieldMeta):
+            static_fragment = field_meta.get_static_fragment()
+            if static_fragment is not None:
+                return join_fragments(static_fragment, dumps_fragment(field_meta.get_dynamic_part()))
+        return dumps(field_meta)
+
+    def render_fields(self, fields: t.Iterable) -> bytes:
+        return b'[' + b','.join(self.render_field(field_meta) for field_meta in fields) + b']'
+
+    def render_metadata(self, data: t.Mapping) -> bytes:
+        parts = []
+        for key, value in data.items():
+            if key == 'fields':
+                encoded_value = self.render_fields(value)
+            else:
+                encoded_value = dumps(value)
+            parts.append(dumps(key) + b':' + encoded_value)
+        return join_fragments(*parts)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict) or 'fields' not in data:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return self.render_metadata(data)
@@ -3,6 +3,7 @@ DEBUG = True
 SECRET_KEY = 'lol'
 
 INSTALLED_APPS = [
+    'django.contrib.contenttypes',
     'pytests.test_app',
 ]
 
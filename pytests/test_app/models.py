@@ -1,3 +1,5 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils.timezone import now
 
@@ -51,3 +53,63 @@ class Book(models.Model):
     authors = models.ManyToManyField(Author)
     publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE)
 
+
+class Category(models.Model):
+    name = models.CharField(max_length=255)
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE)
+
+    def __str__(self):
+        if self.parent_id:
+            return '%s / %s' % (self.parent.name, self.name)
+        return self.name
+
+
+class Article(models.Model):
+    title = models.CharField(max_length=255)
+    author = models.ForeignKey(Author, related_name='articles', on_delete=models.CASCADE)
+    editor = models.ForeignKey(Author, related_name='edited_articles', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+
+
+class Country(models.Model):
+    name = models.CharField(max_length=255)
+    capital = models.ForeignKey('City', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+
+
+class City(models.Model):
+    name = models.CharField(max_length=255)
+    country = models.ForeignKey(Country, null=True, blank=True, on_delete=models.CASCADE)
+
+
+class Stop(models.Model):
+    city = models.ForeignKey(City, on_delete=models.CASCADE)
+
+
+class Trip(models.Model):
+    country = models.ForeignKey(Country, on_delete=models.CASCADE)
+    stop = models.ForeignKey(Stop, on_delete=models.CASCADE)
+
+
+class Rate(models.Model):
+    name = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    period = models.DurationField()
+    options = models.JSONField(default=dict)
+
+
+class Subscription(models.Model):
+    rate = models.ForeignKey(Rate, on_delete=models.CASCADE)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE)
+
+
+class Bookmark(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    target = GenericForeignKey('content_type', 'object_id')
+
+    def __str__(self):
+        return str(self.target)
+
+
+class Reader(models.Model):
+    bookmark = models.ForeignKey(Bookmark, on_delete=models.CASCADE)
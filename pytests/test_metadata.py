@@ -1,9 +1,23 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from django.core.cache import caches
+from django.db import connection
 from django.http import HttpRequest
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 
-from drf_metadata.meta import MetaData, AbstractField, CustomMetadata
-from pytests.test_app.models import Author, Book, Publisher
-from pytests.utils import force_evaluate, get_field_by_name, NoneSerializer
+from drf_metadata.encoding import dumps
+from drf_metadata.meta import MetaData, AbstractField, CustomMetadata, invalidate_related_data, EXPAND_ALL
+from drf_metadata.renderers import MetaDataJSONRenderer
+from pytests.test_app.models import (
+    Article, Author, Book, Bookmark, Category, City, Publisher, Rate, Reader, Stop, Subscription, Trip
+)
+from pytests.utils import force_evaluate, get_field_by_name, NoneSerializer, AuthorSerializer, RateSerializer
 
 
 def prepare_dataset():
@@ -134,6 +148,17 @@ class MetaDataTest:
         metadata = force_evaluate(_metadata)
         assert get_field_by_name(metadata, 'state')['choices'] == [[0, 'Active'], [1, 'Disabled']]
 
+    def test__shared_choices_are_read_only(self):
+        fields = list(PublisherMetaData().determine_metadata(HttpRequest(), MyAPIView())['fields'])
+        state = next(f for f in fields if f['name'] == 'state')
+        with pytest.raises(AttributeError):
+            state['choices'].append((2, 'Deleted'))
+        with pytest.raises(TypeError):
+            state['choices'][0][1] = 'Deleted'
+
+        metadata = force_evaluate(PublisherMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert get_field_by_name(metadata, 'state')['choices'] == [[0, 'Active'], [1, 'Disabled']]
+
     # noinspection PyPep8Naming
     def test__get_NAME_queryset(self):
         # noinspection PyMethodMayBeStatic
@@ -237,6 +262,727 @@ class MetaDataTest:
         assert metadata_field['object'] == str(sentinel)
 
 
+# noinspection PyMethodMayBeStatic,PyPep8Naming
+class RelatedDataCacheTest:
+    class TenantBookMetaData(BookMetaData):
+        fields = ['publisher']
+
+        def get_publisher_queryset(self, field):
+            return Publisher.objects.filter(name__startswith=self.request.tenant)
+
+        def get_publisher_cache_key(self, field, request, obj=None):
+            return request.tenant
+
+    def get_publisher_data(self, tenant, expected_queries):
+        request = HttpRequest()
+        request.tenant = tenant
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(self.TenantBookMetaData().determine_metadata(request, MyAPIView()))
+        assert len(ctx.captured_queries) == expected_queries
+        return [data['name'] for data in get_field_by_name(metadata, 'publisher')['data']]
+
+    def test__cache_is_scoped_by_cache_key(self):
+        invalidate_related_data(Publisher)
+
+        assert self.get_publisher_data('pub', 1) == ['pub0', 'pub1', 'pub2']
+        assert self.get_publisher_data('pub', 0) == ['pub0', 'pub1', 'pub2']
+        assert self.get_publisher_data('pub1', 1) == ['pub1']
+        assert self.get_publisher_data('pub1', 0) == ['pub1']
+
+    def test__invalidate_related_data(self):
+        invalidate_related_data(Publisher)
+        assert self.get_publisher_data('pub', 1) == ['pub0', 'pub1', 'pub2']
+
+        invalidate_related_data(Publisher)
+        assert self.get_publisher_data('pub', 1) == ['pub0', 'pub1', 'pub2']
+
+    def test__no_cache_key_no_cache(self):
+        class NoCacheBookMetaData(self.TenantBookMetaData):
+            def get_publisher_cache_key(self, field, request, obj=None):
+                return None
+
+        request = HttpRequest()
+        request.tenant = 'pub'
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as ctx:
+                force_evaluate(NoCacheBookMetaData().determine_metadata(request, MyAPIView()))
+            assert len(ctx.captured_queries) == 1
+
+
+# noinspection PyMethodMayBeStatic
+class StaleWhileRevalidateTest:
+    def setup_method(self):
+        caches['default'].clear()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        class StaleBookMetaData(RelatedDataCacheTest.TenantBookMetaData):
+            cache_timeout = 0
+            stale_while_revalidate = 60
+            refresh_executor = self.executor
+
+        self.metadata_class = StaleBookMetaData
+
+    def teardown_method(self):
+        self.executor.shutdown(wait=True)
+        Publisher.objects.filter(name='pub3').delete()
+
+    def get_publisher_data(self, expected_queries):
+        request = HttpRequest()
+        request.tenant = 'pub'
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(self.metadata_class().determine_metadata(request, MyAPIView()))
+        assert len(ctx.captured_queries) == expected_queries
+        return [data['name'] for data in get_field_by_name(metadata, 'publisher')['data']]
+
+    def wait_for_refresh(self):
+        self.executor.submit(lambda: None).result()
+
+    def test__stale_data_is_served_while_refreshing(self):
+        assert self.get_publisher_data(1) == ['pub0', 'pub1', 'pub2']
+        Publisher.objects.create(name='pub3')
+
+        assert self.get_publisher_data(0) == ['pub0', 'pub1', 'pub2']
+        self.wait_for_refresh()
+        assert self.get_publisher_data(0) == ['pub0', 'pub1', 'pub2', 'pub3']
+        self.wait_for_refresh()
+
+    def test__single_flight_refresh(self):
+        self.get_publisher_data(1)
+
+        release = threading.Event()
+        self.executor.submit(release.wait)
+
+        metadata = self.metadata_class()
+        field = Book._meta.get_field('publisher')
+        metadata.request = HttpRequest()
+        metadata.request.tenant = 'pub'
+        cache_key = metadata.get_related_data_cache_key(field)
+
+        assert metadata.schedule_refresh(field, cache_key) is not None
+        assert metadata.schedule_refresh(field, cache_key) is None
+
+        release.set()
+        self.wait_for_refresh()
+        assert metadata.schedule_refresh(field, cache_key) is not None
+        self.wait_for_refresh()
+
+    def test__last_known_data_is_served_after_invalidation(self):
+        assert self.get_publisher_data(1) == ['pub0', 'pub1', 'pub2']
+        Publisher.objects.create(name='pub3')
+        invalidate_related_data(Publisher)
+
+        assert self.get_publisher_data(0) == ['pub0', 'pub1', 'pub2']
+        self.wait_for_refresh()
+        assert self.get_publisher_data(0) == ['pub0', 'pub1', 'pub2', 'pub3']
+        self.wait_for_refresh()
+
+    def get_locked_metadata(self):
+        metadata = self.metadata_class()
+        metadata.request = HttpRequest()
+        metadata.request.tenant = 'pub'
+        field = Book._meta.get_field('publisher')
+        cache_key = metadata.get_related_data_cache_key(field)
+        assert caches['default'].add(cache_key + ':lock', 1)
+        return metadata, field, cache_key
+
+    def test__cache_miss_waits_for_lock_holder(self):
+        metadata, field, cache_key = self.get_locked_metadata()
+        timer = threading.Timer(0.1, metadata.set_cached_related_data, [field, cache_key, ['built elsewhere']])
+        timer.start()
+
+        with CaptureQueriesContext(connection) as ctx:
+            assert metadata.get_field_related_data(field) == ['built elsewhere']
+        assert len(ctx.captured_queries) == 0
+        timer.join()
+        caches['default'].delete(cache_key + ':lock')
+
+    def test__cache_miss_lock_wait_timeout(self):
+        self.metadata_class.lock_wait_timeout = 0.1
+        metadata, field, cache_key = self.get_locked_metadata()
+
+        with CaptureQueriesContext(connection) as ctx:
+            assert [data['name'] for data in metadata.get_field_related_data(field)] == ['pub0', 'pub1', 'pub2']
+        assert len(ctx.captured_queries) == 1
+        caches['default'].delete(cache_key + ':lock')
+
+
+# noinspection PyMethodMayBeStatic
+class ExpandTest:
+    def test__expand_field(self):
+        class CustomBookMetaData(BookMetaData):
+            expand = ['publisher']
+
+        metadata = force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+
+        publisher_fields = get_field_by_name(metadata, 'publisher')['fields']
+        assert [f['name'] for f in publisher_fields] == ['name', 'state']
+        assert 'fields' not in get_field_by_name(metadata, 'authors')
+
+    def test__expand_metadata(self):
+        class CustomBookMetaData(BookMetaData):
+            expand = ['publisher']
+            expand_metadata = {
+                'publisher': type('StatePublisherMetaData', (PublisherMetaData,), {'fields': ['state']})
+            }
+
+        metadata = force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert [f['name'] for f in get_field_by_name(metadata, 'publisher')['fields']] == ['state']
+
+    def test__cycles_are_not_expanded(self):
+        class CategoryMetaData(MetaData):
+            model = Category
+            expand = EXPAND_ALL
+            expand_depth = 5
+
+        metadata = force_evaluate(CategoryMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert 'fields' not in get_field_by_name(metadata, 'parent')
+
+    def test__depth_and_memoization(self):
+        class ArticleMetaData(MetaData):
+            model = Article
+            expand = EXPAND_ALL
+            expand_depth = 2
+
+        fields = list(ArticleMetaData().determine_metadata(HttpRequest(), MyAPIView())['fields'])
+        fields_by_name = {f['name']: f for f in fields}
+
+        assert fields_by_name['author']['fields'] is fields_by_name['editor']['fields']
+
+        category_fields = {f['name']: f for f in fields_by_name['category']['fields']}
+        # Category -> parent is a cycle
+        assert 'fields' not in category_fields['parent']
+
+    def test__pruned_schemas_are_not_memoized(self):
+        class TripMetaData(MetaData):
+            model = Trip
+            expand = EXPAND_ALL
+            expand_depth = 3
+
+        metadata = force_evaluate(TripMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+
+        # Trip -> country -> capital (City) -> country is a cycle
+        capital = get_field_by_name(get_field_by_name(metadata, 'country'), 'capital')
+        assert 'fields' not in get_field_by_name(capital, 'country')
+
+        # Trip -> stop -> city (City) -> country is not
+        city = get_field_by_name(get_field_by_name(metadata, 'stop'), 'city')
+        assert [f['name'] for f in get_field_by_name(city, 'country')['fields']] == ['name', 'capital']
+
+    def test__nested_data_is_not_inlined_by_default(self):
+        class TripMetaData(MetaData):
+            model = Trip
+            expand = EXPAND_ALL
+            expand_depth = 2
+
+            def get_stop_queryset(self, field):
+                return Stop.objects.none()
+
+        class CityMetaData(MetaData):
+            model = City
+
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(TripMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        # country dataset only; empty stop queryset makes no query
+        assert len(ctx.captured_queries) == 1
+
+        stop = get_field_by_name(metadata, 'stop')
+        assert stop['data'] == []
+        assert 'data' not in get_field_by_name(stop, 'city')
+        assert 'data' not in get_field_by_name(get_field_by_name(stop, 'city'), 'country')
+
+        class CityTripMetaData(TripMetaData):
+            expand_metadata = {'stop': type('CityStopMetaData', (MetaData,), {'model': Stop})}
+
+        metadata = force_evaluate(CityTripMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert get_field_by_name(get_field_by_name(metadata, 'stop'), 'city')['data'] == []
+
+
+# noinspection PyMethodMayBeStatic
+class QueryPlanningTest:
+    def setup_method(self):
+        Category.objects.all().delete()
+        root = Category.objects.create(name='root')
+        for i in range(2):
+            Category.objects.create(name='child%s' % i, parent=root)
+
+    def get_category_data(self, metadata_class, expected_queries):
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(metadata_class().determine_metadata(HttpRequest(), MyAPIView()))
+        assert len(ctx.captured_queries) == expected_queries
+        return sorted(data['name'] for data in get_field_by_name(metadata, 'category')['data'])
+
+    def test__auto_select_related(self, caplog):
+        class ArticleMetaData(MetaData):
+            model = Article
+            fields = ['category']
+
+        expected = ['root', 'root / child0', 'root / child1']
+        assert self.get_category_data(ArticleMetaData, 3) == expected
+        assert 'took 3 queries, expected at most 1' in caplog.text
+
+        caplog.clear()
+        assert self.get_category_data(ArticleMetaData, 1) == expected
+        assert not caplog.text
+
+    def test__auto_select_related_without_query_count_guard(self):
+        class ArticleMetaData(MetaData):
+            model = Article
+            fields = ['category']
+            query_count_guard = False
+
+        self.get_category_data(ArticleMetaData, 3)
+        self.get_category_data(ArticleMetaData, 1)
+
+    def test__auto_select_related_deferred_fields(self):
+        class ArticleMetaData(MetaData):
+            model = Article
+            fields = ['category']
+
+            def get_category_queryset(self, field):
+                return Category.objects.only('id', 'name')
+
+        expected = ['root', 'root / child0', 'root / child1']
+        # deferred parent_id (3 rows) and parent (2 children) are loaded per row, no relations are selected
+        assert self.get_category_data(ArticleMetaData, 6) == expected
+        assert self.get_category_data(ArticleMetaData, 6) == expected
+
+    def test__generic_foreign_keys_are_not_learned(self):
+        Bookmark.objects.all().delete()
+        for author in Author.objects.order_by('name')[:2]:
+            Bookmark.objects.create(target=author)
+
+        class ReaderMetaData(MetaData):
+            model = Reader
+            fields = ['bookmark']
+
+        field = Reader._meta.get_field('bookmark')
+        for _ in range(2):
+            metadata = force_evaluate(ReaderMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+            assert [data['name'] for data in get_field_by_name(metadata, 'bookmark')['data']] == ['author0', 'author1']
+        assert not ReaderMetaData._learned_select_related.get((ReaderMetaData, field))
+
+    def test__invalid_learned_lookups_are_dropped(self, caplog):
+        class ArticleMetaData(MetaData):
+            model = Article
+            fields = ['category']
+
+        field = Article._meta.get_field('category')
+        ArticleMetaData._learned_select_related[(ArticleMetaData, field)] = frozenset(['nope'])
+
+        assert self.get_category_data(ArticleMetaData, 3) == ['root', 'root / child0', 'root / child1']
+        assert 'learned select_related lookups of `category` are invalid' in caplog.text
+        assert ArticleMetaData._learned_select_related[(ArticleMetaData, field)] == frozenset(['parent'])
+
+    def test__declared_select_related(self, caplog):
+        class ArticleMetaData(MetaData):
+            model = Article
+            fields = ['category']
+            auto_select_related = False
+            select_related = {'category': ['parent']}
+
+        assert len(self.get_category_data(ArticleMetaData, 1)) == 3
+        assert not caplog.text
+
+    def test__max_queries(self, caplog):
+        class ArticleMetaData(MetaData):
+            model = Article
+            fields = ['category']
+            auto_select_related = False
+            max_queries = {'category': 3}
+
+        self.get_category_data(ArticleMetaData, 3)
+        self.get_category_data(ArticleMetaData, 3)
+        assert not caplog.text
+
+
+# noinspection PyMethodMayBeStatic,PyPep8Naming
+class InlineDataPolicyTest:
+    def setup_method(self):
+        caches['default'].clear()
+
+    def test__max_inline_rows(self):
+        class CustomBookMetaData(BookMetaData):
+            max_inline_rows = 2
+            fallback_dataset_urls = {'publisher': '/publisher/'}
+
+            def get_authors_fallback_dataset_url(self, field, obj=None):
+                return '/author/'
+
+            def get_authors_queryset(self, field):
+                return Author.objects.filter(name__in=['author0', 'author1'])
+
+        metadata = force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert get_field_by_name(metadata, 'publisher')['data'] == '/publisher/'
+        assert len(get_field_by_name(metadata, 'authors')['data']) == 2
+
+    def test__no_fallback_url_data_is_inlined(self):
+        class CustomBookMetaData(BookMetaData):
+            max_inline_rows = 1
+
+        metadata = force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert len(get_field_by_name(metadata, 'publisher')['data']) == 3
+
+    def test__max_inline_bytes(self):
+        class CustomBookMetaData(BookMetaData):
+            fields = ['publisher']
+            max_inline_bytes = 20
+            fallback_dataset_urls = {'publisher': '/publisher/'}
+
+        for expected_queries in [2, 0]:
+            with CaptureQueriesContext(connection) as ctx:
+                metadata = force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+            assert get_field_by_name(metadata, 'publisher')['data'] == '/publisher/'
+            # the first call counts and serializes dataset, the next one relies on cached count and learned row size
+            assert len(ctx.captured_queries) == expected_queries
+
+    def test__empty_dataset_row_size_is_not_learned(self):
+        class TenantBookMetaData(RelatedDataCacheTest.TenantBookMetaData):
+            max_inline_bytes = 50
+            fallback_dataset_urls = {'publisher': '/publisher/'}
+
+            def get_publisher_cache_key(self, field, request, obj=None):
+                return None
+
+        for tenant, expected_data in [('nobody', []), ('pub', '/publisher/'), ('pub', '/publisher/')]:
+            request = HttpRequest()
+            request.tenant = tenant
+            metadata = force_evaluate(TenantBookMetaData().determine_metadata(request, MyAPIView()))
+            assert get_field_by_name(metadata, 'publisher')['data'] == expected_data
+
+    def test__cached_datasets_are_not_measured(self, monkeypatch):
+        dumps_calls = []
+        monkeypatch.setattr('drf_metadata.meta.dumps', lambda obj: dumps_calls.append(obj) or dumps(obj))
+
+        class TenantBookMetaData(RelatedDataCacheTest.TenantBookMetaData):
+            max_inline_bytes = 1000
+            fallback_dataset_urls = {'publisher': '/publisher/'}
+
+        request = HttpRequest()
+        request.tenant = 'pub'
+        invalidate_related_data(Publisher)
+        for expected_dumps_calls in [1, 1]:
+            metadata = force_evaluate(TenantBookMetaData().determine_metadata(request, MyAPIView()))
+            assert len(get_field_by_name(metadata, 'publisher')['data']) == 3
+            assert len(dumps_calls) == expected_dumps_calls
+
+        # size stored with cached dataset is enough to fall back
+        metadata = TenantBookMetaData()
+        metadata.request = request
+        field = Book._meta.get_field('publisher')
+        TenantBookMetaData._learned_row_sizes.pop((TenantBookMetaData, field))
+        metadata.set_cached_related_data(field, metadata.get_related_data_cache_key(field), [], 2000)
+        assert metadata.get_field_data(field) == '/publisher/'
+        assert len(dumps_calls) == 1
+
+    def test__row_size_running_average(self):
+        metadata = BookMetaData()
+        field = Book._meta.get_field('publisher')
+        metadata.learn_row_size(field, 100, 10)
+        metadata.learn_row_size(field, 300, 10)
+        metadata.learn_row_size(field, 2, 0)
+        assert BookMetaData._learned_row_sizes[(BookMetaData, field)] == (20.0, 2)
+
+    def test__count_is_cached(self):
+        class CustomBookMetaData(BookMetaData):
+            fields = ['publisher']
+            max_inline_rows = 1000
+            fallback_dataset_urls = {'publisher': '/publisher/'}
+
+        force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView()))
+        assert len(get_field_by_name(metadata, 'publisher')['data']) == 3
+        assert len(ctx.captured_queries) == 1
+
+
+# noinspection PyMethodMayBeStatic
+class SparseFieldsetTest:
+    def test__only(self):
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(BookMetaData().determine_metadata(HttpRequest(), MyAPIView(), only=['title']))
+
+        assert [f['name'] for f in metadata['fields']] == ['title']
+        assert len(ctx.captured_queries) == 0
+
+    class QueryBookMetaData(BookMetaData):
+        fields_query_param = 'fields'
+
+    def test__fields_query_param(self):
+        request = HttpRequest()
+        request.GET['fields'] = 'publisher, title'
+
+        metadata = force_evaluate(self.QueryBookMetaData().determine_metadata(request, MyAPIView()))
+        assert [f['name'] for f in metadata['fields']] == ['title', 'publisher']
+
+    def test__fields_query_param_disabled_by_default(self):
+        request = HttpRequest()
+        request.GET['fields'] = 'title'
+
+        metadata = force_evaluate(BookMetaData().determine_metadata(request, MyAPIView()))
+        assert len(metadata['fields']) == 3
+
+    def test__unknown_fields(self):
+        request = HttpRequest()
+        request.GET['fields'] = 'title,typo'
+
+        with pytest.raises(ValidationError) as exc_info:
+            self.QueryBookMetaData().determine_metadata(request, MyAPIView())
+        assert exc_info.value.detail == {'fields': ['Unknown fields: typo']}
+
+        with pytest.raises(ValueError):
+            BookMetaData().determine_metadata(HttpRequest(), MyAPIView(), only=['typo'])
+
+
+# noinspection PyMethodMayBeStatic
+class BatchRelatedDataTest:
+    def setup_method(self):
+        # database features are checked with queries on first access
+        assert connection.features.has_json_object_function
+
+    def describe(self, metadata_class, expected_queries):
+        with CaptureQueriesContext(connection) as ctx:
+            metadata = force_evaluate(metadata_class().determine_metadata(HttpRequest(), MyAPIView()))
+        assert len(ctx.captured_queries) == expected_queries
+        return metadata
+
+    def test__single_query(self):
+        class BatchBookMetaData(BookMetaData):
+            batch_related_data = True
+
+        assert self.describe(BatchBookMetaData, 1) == self.describe(BookMetaData, 2)
+
+    def test__ordering_and_filters(self):
+        class BatchBookMetaData(BookMetaData):
+            batch_related_data = ['publisher', 'authors']
+
+            def get_authors_queryset(self, field):
+                return Author.objects.filter(name__in=['author0', 'author2']).order_by('-name')
+
+        metadata = self.describe(BatchBookMetaData, 1)
+        assert [data['name'] for data in get_field_by_name(metadata, 'authors')['data']] == ['author2', 'author0']
+        assert [data['name'] for data in get_field_by_name(metadata, 'publisher')['data']] == ['pub0', 'pub1', 'pub2']
+
+    def test__rebuilt_instances(self):
+        class BatchBookMetaData(BookMetaData):
+            batch_related_data = True
+            serializers = {'authors': AuthorSerializer}
+
+        metadata = self.describe(BatchBookMetaData, 1)
+        assert get_field_by_name(metadata, 'authors')['data'][0]['birth'] == '1950-02-02'
+
+    def test__not_batchable_fields(self):
+        class BatchBookMetaData(BookMetaData):
+            batch_related_data = True
+            dataset_urls = {'authors': '/author/'}
+
+        # the only batched field is fetched with a plain query
+        self.describe(BatchBookMetaData, 1)
+
+        assert BookMetaData.is_batchable_queryset(Author.objects.all()) is True
+        assert BookMetaData.is_batchable_queryset(Author.objects.all()[:1]) is False
+        assert BookMetaData.is_batchable_queryset(Author.objects.values()) is False
+        assert BookMetaData.is_batchable_queryset(Book.objects.select_related('publisher')) is False
+        assert BookMetaData.is_batchable_queryset(Book.objects.all()) is True
+
+    def test__json_object_max_args(self):
+        class BatchBookMetaData(BookMetaData):
+            batch_related_data = True
+            json_object_max_args = {connection.vendor: 5}
+
+        # authors (id, name, birth) take 6 arguments, publisher (id, name, state) too
+        assert BatchBookMetaData.is_batchable_queryset(Author.objects.all()) is False
+        self.describe(BatchBookMetaData, 2)
+
+    def test__not_batchable_columns(self):
+        Rate.objects.all().delete()
+        Rate.objects.create(name='rate0', amount='1.10', period=timedelta(days=1), options={'a': [1]})
+
+        class SubscriptionMetaData(MetaData):
+            model = Subscription
+            serializers = {'rate': RateSerializer, 'author': AuthorSerializer}
+
+        class BatchSubscriptionMetaData(SubscriptionMetaData):
+            batch_related_data = True
+
+        metadata = self.describe(BatchSubscriptionMetaData, 2)
+        assert metadata == self.describe(SubscriptionMetaData, 2)
+        assert get_field_by_name(metadata, 'rate')['data'] == [
+            {'name': 'rate0', 'amount': '1.10', 'period': '1 00:00:00', 'options': {'a': [1]}}
+        ]
+
+        assert BookMetaData.is_batchable_queryset(Rate.objects.all()) is False
+        assert BookMetaData.is_batchable_queryset(Subscription.objects.all()) is True
+
+
+# noinspection PyMethodMayBeStatic
+class ExportTest:
+    def test__export_field_data(self):
+        response = BookMetaData().export_field_data(HttpRequest(), 'authors', MyAPIView(), chunk_size=2)
+        assert response['Content-Type'] == 'application/x-ndjson'
+
+        with CaptureQueriesContext(connection) as ctx:
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        assert [json.loads(line)['name'] for line in lines] == ['author0', 'author1', 'author2']
+        assert len(ctx.captured_queries) == 2
+
+    def test__export_uses_field_serializer(self):
+        class CustomBookMetaData(BookMetaData):
+            serializers = {
+                'publisher': NoneSerializer
+            }
+
+        response = CustomBookMetaData().export_field_data(HttpRequest(), 'publisher', chunk_size=1)
+        assert b''.join(response.streaming_content) == b'{}\n{}\n{}\n'
+
+    def test__not_relation_field(self):
+        with pytest.raises(ValueError):
+            BookMetaData().export_field_data(HttpRequest(), 'title')
+
+    def test__not_selected_field(self):
+        class CustomPublisherMetaData(PublisherMetaData):
+            fields = ['name']
+
+        with pytest.raises(ValueError):
+            CustomPublisherMetaData().export_field_data(HttpRequest(), 'book')
+
+    def test__not_exportable_queryset(self):
+        for queryset in [Author.objects.all()[:2], list(Author.objects.all()), Author.objects.values()]:
+            class CustomBookMetaData(BookMetaData):
+                def get_authors_queryset(self, field, queryset=queryset):
+                    return queryset
+
+            with pytest.raises(ValueError):
+                CustomBookMetaData().export_field_data(HttpRequest(), 'authors')
+
+            metadata = CustomBookMetaData()
+            with pytest.raises(ValueError):
+                list(metadata.stream_field_related_data(Book._meta.get_field('authors')))
+
+    def test__no_data_field(self):
+        class CustomBookMetaData(BookMetaData):
+            no_data = ['authors']
+
+        with pytest.raises(ValueError):
+            CustomBookMetaData().export_field_data(HttpRequest(), 'authors')
+
+
+# noinspection PyMethodMayBeStatic,PyPep8Naming
+class CustomMetaDataCopyOnWriteTest:
+    class RequestImpersonateMetadata(ImpersonateMetadata):
+        def get_field_user_id(self, field_name, request):
+            return {'lol': request.lol}
+
+    def describe(self, lol):
+        request = HttpRequest()
+        request.lol = lol
+        return list(self.RequestImpersonateMetadata().determine_metadata(request, MyAPIView())['fields'])
+
+    def test__base_fields_are_not_modified(self):
+        assert self.describe(1)[0]['lol'] == 1
+        assert self.describe(2)[0]['lol'] == 2
+        assert 'lol' not in ImpersonateMetadata.fields[0]
+
+    def test__base_fields_are_shared(self):
+        field0, field1 = self.describe(1)[0], self.describe(2)[0]
+        assert field0.static is field1.static
+        assert field0.get_static_fragment() is not None
+
+        with pytest.raises(TypeError):
+            field0.static.data['lol'] = 1
+
+    def test__nested_values_are_read_only(self):
+        class NestedMetadata(CustomMetadata):
+            fields = (
+                AbstractField(type='ChoiceField', name='kind', verbose_name='Kind',
+                              choices=[['a', 'A']], extra={'tags': ['x']}),
+            )
+
+        for _ in range(2):
+            field = list(NestedMetadata().determine_metadata(HttpRequest(), MyAPIView())['fields'])[0]
+            with pytest.raises(TypeError):
+                field['extra']['tags'] = []
+            with pytest.raises(AttributeError):
+                field['extra']['tags'].append('y')
+
+            rendered = json.loads(MetaDataJSONRenderer().render({'fields': [field]}).decode())
+            assert rendered['fields'][0]['choices'] == [['a', 'A']]
+            assert rendered['fields'][0]['extra'] == {'tags': ['x']}
+            assert force_evaluate({'fields': [field]}) == rendered
+
+    def test__rendered_output(self):
+        request = HttpRequest()
+        request.lol = 1
+        _metadata = self.RequestImpersonateMetadata().determine_metadata(request, MyAPIView())
+        rendered = json.loads(MetaDataJSONRenderer().render(_metadata).decode())
+        assert rendered['fields'][0]['lol'] == 1
+        assert rendered['fields'][0]['data'] == '/data/'
+
+
+# noinspection PyMethodMayBeStatic
+class SharedInstanceTest:
+    class AuthorsBookMetaData(BookMetaData):
+        fields = ['authors']
+
+        def get_authors_queryset(self, field):
+            return Author.objects.filter(name=self.request.author_name)
+
+    def describe(self, metadata, author_name):
+        request = HttpRequest()
+        request.author_name = author_name
+        return metadata.determine_metadata(request, MyAPIView())
+
+    def test__interleaved_calls(self):
+        metadata = self.AuthorsBookMetaData()
+        result0 = self.describe(metadata, 'author0')
+        result1 = self.describe(metadata, 'author1')
+
+        assert get_field_by_name(force_evaluate(result1), 'authors')['data'][0]['name'] == 'author1'
+        assert get_field_by_name(force_evaluate(result0), 'authors')['data'][0]['name'] == 'author0'
+        assert metadata.request is None
+
+    def test__threads(self):
+        metadata = self.AuthorsBookMetaData()
+
+        def describe(author_name):
+            try:
+                data = get_field_by_name(force_evaluate(self.describe(metadata, author_name)), 'authors')['data']
+                return data[0]['name']
+            finally:
+                connection.close()
+
+        author_names = ['author%s' % (i % 3) for i in range(12)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            assert list(executor.map(describe, author_names)) == author_names
+
+    def test__custom_metadata(self):
+        # noinspection PyMethodMayBeStatic
+        class RequestMetadata(CustomMetadata):
+            def get_user(self, request):
+                return {'name': 'user', 'same_request': request is self.request}
+
+        metadata = RequestMetadata()
+        result = force_evaluate(metadata.determine_metadata(HttpRequest(), MyAPIView()))
+        assert result['fields'] == [{'name': 'user', 'same_request': True}]
+        assert metadata.request is None
+
+    def test__get_obj_and_get_title_hooks(self):
+        class HookMixin:
+            def get_obj(self, request, view):
+                return 'obj of %s' % type(self.request).__name__
+
+            def get_title(self, request, view, obj=None):
+                return '%s %s %s' % (self.obj, self.request is request, self.view is view)
+
+        view = MyAPIView()
+        for metadata_class in [type('HookBookMetaData', (HookMixin, BookMetaData), {}),
+                               type('HookCustomMetadata', (HookMixin, CustomMetadata), {})]:
+            metadata = metadata_class()
+            assert metadata.determine_metadata(HttpRequest(), view)['title'] == 'obj of HttpRequest True True'
+            assert metadata.request is None
+            assert metadata.obj is None
+
+
 # noinspection PyMethodMayBeStatic
 class AbstractFieldTest:
     def test_field(self):
@@ -0,0 +1,40 @@
+import json
+
+from django.http import HttpRequest
+
+from drf_metadata.meta import FieldMeta
+from drf_metadata.renderers import MetaDataJSONRenderer
+from pytests.test_metadata import BookMetaData, MyAPIView, PublisherMetaData
+from pytests.utils import force_evaluate
+
+
+# noinspection PyMethodMayBeStatic
+class MetaDataJSONRendererTest:
+    def test__output_matches_default_renderer(self):
+        for metadata_class in [BookMetaData, PublisherMetaData]:
+            expected = force_evaluate(metadata_class().determine_metadata(HttpRequest(), MyAPIView()))
+            rendered = MetaDataJSONRenderer().render(metadata_class().determine_metadata(HttpRequest(), MyAPIView()))
+            assert json.loads(rendered.decode()) == expected
+
+    def test__static_meta_is_shared_between_calls(self):
+        fields1 = list(BookMetaData().determine_metadata(HttpRequest(), MyAPIView())['fields'])
+        fields2 = list(BookMetaData().determine_metadata(HttpRequest(), MyAPIView())['fields'])
+
+        assert isinstance(fields1[0], FieldMeta)
+        assert fields1[0].static is fields2[0].static
+        assert fields1[0].get_static_fragment() is fields2[0].get_static_fragment()
+
+    def test__overridden_static_values_are_not_taken_from_fragment(self):
+        class CustomBookMetaData(BookMetaData):
+            update_fields = {
+                'title': {'verbose_name': 'overridden'}
+            }
+
+        fields = list(CustomBookMetaData().determine_metadata(HttpRequest(), MyAPIView())['fields'])
+        assert fields[0].get_static_fragment() is None
+
+        rendered = MetaDataJSONRenderer().render({'fields': fields})
+        assert json.loads(rendered.decode())['fields'][0]['verbose_name'] == 'overridden'
+
+    def test__non_metadata_fallback(self):
+        assert json.loads(MetaDataJSONRenderer().render({'detail': 'error'}).decode()) == {'detail': 'error'}
@@ -9,6 +9,21 @@ class NoneSerializer(serializers.Serializer):
     pass
 
 
+# noinspection PyAbstractClass
+class AuthorSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    birth = serializers.DateField()
+
+
+# noinspection PyAbstractClass
+class RateSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    period = serializers.DurationField()
+    options = serializers.JSONField()
+
+
 def force_evaluate(val):
     s = JSONRenderer().render(val)
     return json.loads(s)